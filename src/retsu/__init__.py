@@ -10,6 +10,7 @@ from retsu.core import (
 )
 from retsu.tracking import (
     ResultTaskManager,
+    StreamResultTaskManager,
 )
 
 
@@ -34,6 +35,7 @@ __all__ = [
     "ParallelTask",
     "ResultTaskManager",
     "SerialTask",
+    "StreamResultTaskManager",
     "Task",
     "TaskManager",
 ]
@@ -0,0 +1,316 @@
+"""Retsu tracking classes for asyncio."""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+
+from time import monotonic
+from typing import Any, Coroutine, Optional, TypeVar, cast
+
+import redis
+import redis.asyncio as aioredis
+
+from public import public
+
+try:
+    import uvloop
+except ImportError:  # pragma: no cover
+    uvloop = None  # type: ignore[assignment,unused-ignore]
+
+from retsu.tracking import (
+    LISTENER_READY_TIMEOUT,
+    POLL_INITIAL_DELAY,
+    POLL_MAX_DELAY,
+    RESULT_FIELDS,
+    UPDATE_SCRIPT,
+    _deserialize,
+    _now_ms,
+    _serialize,
+)
+
+T = TypeVar("T")
+
+
+class AsyncTaskMetadataManager:
+    """Manage task metadata with an asyncio redis client."""
+
+    def __init__(self, client: aioredis.Redis):
+        """Initialize AsyncTaskMetadataManager."""
+        self.client = client
+        # the script is sent with EVALSHA, and loaded on the first call
+        self._update_script = self.client.register_script(UPDATE_SCRIPT)
+
+    async def get_all(self, task_id: str) -> dict[str, bytes]:
+        """Get the entire metadata for a given task."""
+        result = await self.client.hgetall(  # type: ignore[misc]
+            f"task:{task_id}:metadata"
+        )
+        return cast("dict[str, bytes]", result)
+
+    async def get(self, task_id: str, attribute: str) -> bytes:
+        """Get a specific metadata attribute for a given task."""
+        result = await self.client.hget(  # type: ignore[misc]
+            f"task:{task_id}:metadata", attribute
+        )
+        return cast(bytes, result)
+
+    async def get_many(
+        self, task_id: str, attributes: list[str]
+    ) -> dict[str, bytes]:
+        """Get the given metadata attributes for a given task."""
+        result = await self.client.hmget(  # type: ignore[misc]
+            f"task:{task_id}:metadata", attributes
+        )
+        return dict(zip(attributes, cast("list[bytes]", result)))
+
+    async def create(self, task_id: str, metadata: dict[str, Any]) -> None:
+        """Create an initial metadata for given task."""
+        await self.client.hset(  # type: ignore[misc]
+            f"task:{task_id}:metadata", mapping=metadata
+        )
+
+    async def update(
+        self, task_id: str, attribute: str, value: Any, channel: str = ""
+    ) -> None:
+        """
+        Update the value of given attribute for a given task.
+
+        If a channel is given, the new value is also published on it.
+        """
+        await self._update_script(
+            keys=[f"task:{task_id}:metadata"],
+            args=[attribute, value, _now_ms(), channel],
+        )
+
+
+class _AsyncWaitRegistry:
+    """
+    Wake up the coroutines waiting for task results.
+
+    A single listener task subscribes to the completion channels of all the
+    tasks and sets the events registered by the waiters, so concurrent
+    calls to `AsyncResultTaskManager.get` share one redis connection.
+    """
+
+    def __init__(self, client: aioredis.Redis) -> None:
+        """Initialize _AsyncWaitRegistry."""
+        self.client = client
+        self._waiters: dict[str, set[asyncio.Event]] = {}
+        self._ready = asyncio.Event()
+        self._listener: Optional[asyncio.Task[None]] = None
+
+    async def register(
+        self, task_id: str, ready_timeout: float = LISTENER_READY_TIMEOUT
+    ) -> asyncio.Event:
+        """
+        Register a waiter for the given task.
+
+        It waits up to `ready_timeout` seconds for the listener to be
+        subscribed.
+        """
+        event = asyncio.Event()
+        self._waiters.setdefault(task_id, set()).add(event)
+        if self._listener is None or self._listener.done():
+            self._ready = asyncio.Event()
+            self._listener = asyncio.create_task(self._listen())
+        # the listener should be subscribed before the waiter checks the
+        # task status, otherwise the notification could be missed
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=ready_timeout)
+        except asyncio.TimeoutError:
+            pass
+        return event
+
+    def unregister(self, task_id: str, event: asyncio.Event) -> None:
+        """Unregister a waiter for the given task."""
+        events = self._waiters.get(task_id, set())
+        events.discard(event)
+        if not events:
+            self._waiters.pop(task_id, None)
+
+    async def close(self) -> None:
+        """Stop the listener task."""
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    def _notify(self, task_id: Optional[str] = None) -> None:
+        """Wake up the waiters for the given task, or all of them."""
+        if task_id is None:
+            events = [e for es in self._waiters.values() for e in es]
+        else:
+            events = list(self._waiters.get(task_id, set()))
+        for event in events:
+            event.set()
+
+    async def _listen(self) -> None:
+        """Listen to the completion channels and notify the waiters."""
+        pubsub = self.client.pubsub()
+        try:
+            while True:
+                try:
+                    if not pubsub.patterns:
+                        await pubsub.psubscribe("task:*:done")
+                    message = await pubsub.get_message(timeout=1.0)
+                except redis.RedisError:
+                    # pubsub subscribes again when it reconnects, meanwhile
+                    # the waiters check the task status by themselves
+                    self._ready.clear()
+                    self._notify()
+                    await asyncio.sleep(1.0)
+                    continue
+
+                if message is None:
+                    continue
+                if message["type"] == "psubscribe":
+                    self._ready.set()
+                elif message["type"] == "pmessage":
+                    channel = message["channel"].decode("utf8")
+                    self._notify(channel[len("task:") : -len(":done")])
+        finally:
+            await pubsub.aclose()  # type: ignore[no-untyped-call]
+
+
+@public
+class AsyncResultTaskManager:
+    """
+    Manage the result and metadata from tasks with asyncio.
+
+    It shares the data layout with ResultTaskManager, so results saved by
+    the task workers can be awaited from an event loop, where many waiters
+    don't need one thread each.
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 6379,
+        db: int = 0,
+        max_connections: int = 50,
+    ) -> None:
+        """Initialize AsyncResultTaskManager."""
+        pool = aioredis.BlockingConnectionPool(
+            host=host,
+            port=port,
+            db=db,
+            max_connections=max_connections,
+            timeout=2,
+            health_check_interval=30,
+            decode_responses=False,
+        )
+        self.client = aioredis.Redis(connection_pool=pool)
+        self.metadata = AsyncTaskMetadataManager(self.client)
+        self._waiters = _AsyncWaitRegistry(self.client)
+
+    async def get(self, task_id: str, timeout: Optional[int] = None) -> Any:
+        """Get the result for a given task."""
+        metadata = await self.metadata.get_many(task_id, RESULT_FIELDS)
+        if timeout and metadata["status"] != b"completed":
+            metadata = await self._wait(task_id, float(timeout))
+
+        if metadata["status"] != b"completed":
+            status = (metadata["status"] or b"").decode("utf8")
+            raise Exception(
+                "Timeout(get): Task result is not ready yet. "
+                f"Task status: {status}"
+            )
+        result = metadata["result"]
+        return _deserialize(result) if result else result
+
+    async def _wait(self, task_id: str, timeout: float) -> dict[str, bytes]:
+        """Wait for the completion of a given task, up to the timeout."""
+        deadline = monotonic() + timeout
+        event = await self._waiters.register(
+            task_id, min(LISTENER_READY_TIMEOUT, timeout)
+        )
+        try:
+            delay = POLL_INITIAL_DELAY
+            metadata = await self.metadata.get_many(task_id, RESULT_FIELDS)
+            while metadata["status"] != b"completed":
+                timeout_countdown = deadline - monotonic()
+                if timeout_countdown <= 0:
+                    break
+                jitter = random.uniform(0, delay * 0.1)  # nosec B311
+                try:
+                    await asyncio.wait_for(
+                        event.wait(),
+                        timeout=min(delay + jitter, timeout_countdown),
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                event.clear()
+                delay = min(delay * 2, POLL_MAX_DELAY)
+                metadata = await self.metadata.get_many(task_id, RESULT_FIELDS)
+        finally:
+            self._waiters.unregister(task_id, event)
+        return metadata
+
+    async def load(
+        self, task_id: str, attributes: Optional[list[str]] = None
+    ) -> dict[str, Any]:
+        """
+        Load the metadata for a given task.
+
+        If attributes are given, just these attributes are loaded.
+        """
+        if attributes:
+            return await self.metadata.get_many(task_id, attributes)
+        return await self.metadata.get_all(task_id)
+
+    async def create(self, task_id: str, metadata: dict[str, Any]) -> None:
+        """Create a new metadata for a given task."""
+        await self.metadata.create(task_id, metadata)
+
+    async def save(self, task_id: str, result: Any) -> None:
+        """Save the result for a given task and mark it as completed."""
+        await self.metadata.update(task_id, "result", _serialize(result))
+        await self.metadata.update(
+            task_id, "status", "completed", channel=f"task:{task_id}:done"
+        )
+
+    async def status(self, task_id: str) -> str:
+        """Get the status for a given task."""
+        status = await self.metadata.get(task_id, "status")
+        return status.decode("utf8")
+
+    async def aclose(self) -> None:
+        """Stop the completion listener and close the redis connections."""
+        await self._waiters.close()
+        # the pool is given to the client, so it isn't closed with it
+        await self.client.connection_pool.disconnect()
+
+
+@public
+def create_async_result_task_manager() -> AsyncResultTaskManager:
+    """Create an AsyncResultTaskManager with environment parameters."""
+    redis_host: str = os.getenv("RETSU_REDIS_HOST", "localhost")
+    redis_port: int = int(os.getenv("RETSU_REDIS_PORT", 6379))
+    redis_db: int = int(os.getenv("RETSU_REDIS_DB", 0))
+    redis_pool_size: int = int(os.getenv("RETSU_REDIS_POOL_SIZE", 50))
+
+    return AsyncResultTaskManager(
+        host=redis_host,
+        port=redis_port,
+        db=redis_db,
+        max_connections=redis_pool_size,
+    )
+
+
+@public
+def run(main: Coroutine[Any, Any, T]) -> T:
+    """
+    Run a coroutine in a new event loop and return its result.
+
+    If uvloop is installed, it is used as the event loop, for a faster
+    socket I/O with many concurrent redis connections.
+    """
+    if uvloop is not None:
+        result: T = uvloop.run(main)
+        return result
+    return asyncio.run(main)
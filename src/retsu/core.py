@@ -6,13 +6,16 @@ import multiprocessing as mp
 import warnings
 
 from abc import abstractmethod
-from datetime import datetime
 from typing import Any, Optional
 from uuid import uuid4
 
 from public import public
 
-from retsu.tracking import ResultTaskManager, create_result_task_manager
+from retsu.tracking import (
+    ResultTaskManager,
+    _now_ms,
+    create_result_task_manager,
+)
 
 
 @public
@@ -57,10 +60,11 @@ class Task:
     def request(self, *args, **kwargs) -> str:  # type: ignore
         """Feed the queue with data from the request for the task."""
         task_id = uuid4().hex
+        now = _now_ms()
         metadata = {
             "status": "starting",
-            "created_at": datetime.now().isoformat(),
-            "updated_at": datetime.now().isoformat(),
+            "created_at": now,
+            "updated_at": now,
         }
         self.result.create(task_id, metadata)
         self.queue_in.put(
@@ -88,7 +92,6 @@ class Task:
             **data["kwargs"],
         )
         self.result.save(task_id, result)
-        self.result.metadata.update(task_id, "status", "completed")
 
     @public
     def run(self) -> None:
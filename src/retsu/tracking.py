@@ -2,11 +2,13 @@
 
 from __future__ import annotations
 
+import math
 import os
 import pickle
+import random
+import threading
 
-from datetime import datetime
-from time import sleep
+from time import monotonic, sleep, time
 from typing import Any, Callable, Optional, cast
 
 try:
@@ -21,6 +23,127 @@ import redis
 
 from public import public
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore[assignment,unused-ignore]
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None  # type: ignore[assignment,unused-ignore]
+
+# the fallback polling interval (in seconds) used while waiting for the
+# completion notification starts small and doubles after each failed status
+# check, up to the max value.
+POLL_INITIAL_DELAY = 0.25
+POLL_MAX_DELAY = 16.0
+
+# max time (in seconds) a waiter waits for the completion listener to be
+# subscribed before checking the task status
+LISTENER_READY_TIMEOUT = 2.0
+
+# time to live (in seconds) of the completion streams, used by
+# StreamResultTaskManager, so they don't pile up in redis
+STREAM_TTL = 24 * 60 * 60
+
+# metadata fields read when getting the result of a task
+RESULT_FIELDS = ["status", "result"]
+
+# serializer used for results: `pickle` handles any python object; `orjson`
+# is faster and more compact for JSON-safe payloads (dicts with str keys,
+# lists, numbers, strings, booleans and None), falling back to pickle for
+# anything else, so the types are kept on the round-trip.
+SERIALIZER = os.getenv("RETSU_SERIALIZER", "pickle")
+
+# compression used for results: `none` stores the serialized data as is;
+# `zstd` compresses the results bigger than the threshold (in bytes) with
+# zstandard, installed with the `zstd` extra. The readers of compressed
+# results need zstandard as well.
+COMPRESSION = os.getenv("RETSU_COMPRESSION", "none")
+COMPRESSION_THRESHOLD = 4096
+COMPRESSION_LEVEL = 3
+
+# one-byte tags prepended to the serialized data
+_PICKLE_TAG = b"P"
+_ORJSON_TAG = b"J"
+_ZSTD_TAG = b"Z"
+
+
+def _now_ms() -> int:
+    """Return the current time as milliseconds since the epoch."""
+    return int(time() * 1000)
+
+
+def _is_json_safe(obj: Any) -> bool:
+    """Check if an object is loaded back from JSON with the same types."""
+    obj_type = type(obj)
+    if obj_type in (str, bool, type(None)):
+        return True
+    if obj_type is int:
+        # orjson only handles 64-bit integers
+        return bool(-(2**63) <= obj < 2**64)
+    if obj_type is float:
+        # nan and infinity are serialized as null
+        return math.isfinite(obj)
+    if obj_type is list:
+        return all(_is_json_safe(value) for value in obj)
+    if obj_type is dict:
+        return all(
+            type(key) is str and _is_json_safe(value)
+            for key, value in obj.items()
+        )
+    return False
+
+
+def _serialize(obj: Any) -> bytes:
+    """Serialize a result, prefixing it with the serializer tag."""
+    data = None
+    if SERIALIZER == "orjson" and orjson is not None and _is_json_safe(obj):
+        data = _ORJSON_TAG + orjson.dumps(obj)
+    if data is None:
+        data = _PICKLE_TAG + pickle.dumps(
+            obj, protocol=pickle.HIGHEST_PROTOCOL
+        )
+    if COMPRESSION == "zstd" and len(data) > COMPRESSION_THRESHOLD:
+        if zstandard is None:
+            raise Exception(
+                "zstandard is required for RETSU_COMPRESSION=zstd."
+            )
+        compressed = _ZSTD_TAG + zstandard.compress(data, COMPRESSION_LEVEL)
+        # incompressible data would grow with the zstd header
+        if len(compressed) < len(data):
+            return compressed
+    return data
+
+
+def _deserialize(data: bytes) -> Any:
+    """Deserialize a result according to its serializer tag."""
+    tag, payload = data[:1], memoryview(data)[1:]
+    if tag == _ZSTD_TAG:
+        if zstandard is None:
+            raise Exception("zstandard is required to load this result.")
+        return _deserialize(zstandard.decompress(payload))
+    if tag == _PICKLE_TAG:
+        return pickle.loads(payload)
+    if tag == _ORJSON_TAG:
+        if orjson is None:
+            raise Exception("orjson is required to load this result.")
+        return orjson.loads(payload)
+    # untagged data saved by previous versions of retsu
+    return pickle.loads(data)
+
+
+# set the attribute and updated_at, and optionally publish the new value on
+# the given channel, in a single atomic round-trip
+UPDATE_SCRIPT = """
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2], 'updated_at', ARGV[3])
+if ARGV[4] ~= '' then
+    redis.call('PUBLISH', ARGV[4], ARGV[2])
+end
+return 1
+"""
+
 
 class TaskMetadataManager:
     """Manage task metadata."""
@@ -29,6 +152,8 @@ class TaskMetadataManager:
         """Initialize TaskMetadataManager."""
         self.client = client
         self.step = StepMetadataManager(self.client)
+        # the script is sent with EVALSHA, and loaded on the first call
+        self._update_script = self.client.register_script(UPDATE_SCRIPT)
 
     def get_all(self, task_id: str) -> dict[str, bytes]:
         """Get the entire metadata for a given task."""
@@ -40,17 +165,34 @@ class TaskMetadataManager:
         result = self.client.hget(f"task:{task_id}:metadata", attribute)
         return cast(bytes, result)
 
+    def get_many(
+        self, task_id: str, attributes: list[str]
+    ) -> dict[str, bytes]:
+        """Get the given metadata attributes for a given task."""
+        return self._get_many_raw(f"task:{task_id}:metadata", attributes)
+
+    def _get_many_raw(
+        self, key: str, attributes: list[str]
+    ) -> dict[str, bytes]:
+        """Get the given metadata attributes from an already built key."""
+        result = self.client.hmget(key, attributes)
+        return dict(zip(attributes, cast("list[bytes]", result)))
+
     def create(self, task_id: str, metadata: dict[str, Any]) -> None:
         """Create an initial metadata for given task."""
         self.client.hset(f"task:{task_id}:metadata", mapping=metadata)
 
-    def update(self, task_id: str, attribute: str, value: Any) -> None:
-        """Update the value of given attribute for a given task."""
-        self.client.hset(f"task:{task_id}:metadata", attribute, value)
-        self.client.hset(
-            f"task:{task_id}:metadata",
-            "updated_at",
-            datetime.now().isoformat(),
+    def update(
+        self, task_id: str, attribute: str, value: Any, channel: str = ""
+    ) -> None:
+        """
+        Update the value of given attribute for a given task.
+
+        If a channel is given, the new value is also published on it.
+        """
+        self._update_script(
+            keys=[f"task:{task_id}:metadata"],
+            args=[attribute, value, _now_ms(), channel],
         )
 
 
@@ -81,15 +223,136 @@ class StepMetadataManager:
         self, task_id: str, step_id: str, attribute: str, value: Any
     ) -> None:
         """Update the value of given attribute for a given task and step."""
-        if attribute == "status" and value not in ["started", "completed"]:
+        self.update_many(task_id, step_id, {attribute: value})
+
+    def update_many(
+        self, task_id: str, step_id: str, values: dict[str, Any]
+    ) -> None:
+        """Update the values of given attributes for a given task and step."""
+        if values.get("status", "started") not in ["started", "completed"]:
             raise Exception("Status should be started or completed.")
 
-        self.client.hset(f"task:{task_id}:step:{step_id}", attribute, value)
-        self.client.hset(
-            f"task:{task_id}:step:{step_id}",
-            "updated_at",
-            datetime.now().isoformat(),
+        self._update_raw(f"task:{task_id}:step:{step_id}", values)
+
+    def _update_raw(self, key: str, values: dict[str, Any]) -> None:
+        """Update the values of given attributes from an already built key."""
+        self.client.hset(key, mapping={**values, "updated_at": _now_ms()})
+
+
+class _WaitRegistry:
+    """
+    Wake up the threads waiting for task results.
+
+    A single background thread listens to the completion channels of all
+    the tasks and sets the events registered by the waiters, so concurrent
+    calls to `ResultTaskManager.get` share one redis connection.
+    """
+
+    def __init__(self, client: redis.Redis) -> None:
+        """Initialize _WaitRegistry."""
+        self.client = client
+        self._lock = threading.Lock()
+        self._waiters: dict[str, set[threading.Event]] = {}
+        self._ready = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def register(
+        self, task_id: str, ready_timeout: float = LISTENER_READY_TIMEOUT
+    ) -> threading.Event:
+        """
+        Register a waiter for the given task.
+
+        It waits up to `ready_timeout` seconds for the listener to be
+        subscribed.
+        """
+        event = threading.Event()
+        with self._lock:
+            self._waiters.setdefault(task_id, set()).add(event)
+            # the listener thread doesn't survive a fork
+            if (
+                self._pid != os.getpid()
+                or self._thread is None
+                or not self._thread.is_alive()
+            ):
+                self._start()
+        # the listener should be subscribed before the waiter checks the
+        # task status, otherwise the notification could be missed
+        self._ready.wait(timeout=ready_timeout)
+        return event
+
+    def unregister(self, task_id: str, event: threading.Event) -> None:
+        """Unregister a waiter for the given task."""
+        with self._lock:
+            events = self._waiters.get(task_id, set())
+            events.discard(event)
+            if not events:
+                self._waiters.pop(task_id, None)
+
+    def close(self) -> None:
+        """Stop the listener thread and close its pubsub connection."""
+        with self._lock:
+            thread = self._thread
+            self._stopped.set()
+            self._thread = None
+            self._pid = None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _notify(self, task_id: Optional[str] = None) -> None:
+        """Wake up the waiters for the given task, or all of them."""
+        with self._lock:
+            if task_id is None:
+                events = [e for es in self._waiters.values() for e in es]
+            else:
+                events = list(self._waiters.get(task_id, set()))
+        for event in events:
+            event.set()
+
+    def _start(self) -> None:
+        """Start the listener thread."""
+        self._pid = os.getpid()
+        self._ready = threading.Event()
+        # each thread has its own stop flag, so a closed thread can't be
+        # kept running by a new one
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._listen,
+            args=(self._ready, self._stopped),
+            name="retsu-wait-registry",
+            daemon=True,
         )
+        self._thread.start()
+
+    def _listen(
+        self, ready: threading.Event, stopped: threading.Event
+    ) -> None:
+        """Listen to the completion channels and notify the waiters."""
+        pubsub = self.client.pubsub()  # type: ignore[no-untyped-call]
+        try:
+            while not stopped.is_set():
+                try:
+                    if not pubsub.patterns:
+                        pubsub.psubscribe("task:*:done")
+                    message = pubsub.get_message(timeout=1.0)
+                except redis.RedisError:
+                    # pubsub subscribes again when it reconnects, meanwhile
+                    # the waiters check the task status by themselves
+                    ready.clear()
+                    self._notify()
+                    stopped.wait(1.0)
+                    continue
+
+                if message is None:
+                    continue
+                if message["type"] == "psubscribe":
+                    ready.set()
+                elif message["type"] == "pmessage":
+                    channel = message["channel"].decode("utf8")
+                    self._notify(channel[len("task:") : -len(":done")])
+        finally:
+            pubsub.close()
 
 
 @public
@@ -97,40 +360,89 @@ class ResultTaskManager:
     """Manage the result and metadata from tasks."""
 
     def __init__(
-        self, host: str = "localhost", port: int = 6379, db: int = 0
+        self,
+        host: str = "localhost",
+        port: int = 6379,
+        db: int = 0,
+        max_connections: int = 50,
     ) -> None:
-        """Initialize ResultTaskManager."""
-        self.client = redis.Redis(
-            host=host, port=port, db=db, decode_responses=False
+        """
+        Initialize ResultTaskManager.
+
+        The redis client uses a blocking connection pool, shared by the
+        task and step metadata managers. The waiters of `get` share one
+        extra connection, used to listen to the task completion.
+        """
+        pool = redis.BlockingConnectionPool(  # type: ignore[no-untyped-call]
+            host=host,
+            port=port,
+            db=db,
+            max_connections=max_connections,
+            timeout=2.0,
+            health_check_interval=30,
+            decode_responses=False,
         )
+        self.client = redis.Redis(connection_pool=pool)
         self.metadata = TaskMetadataManager(self.client)
+        self._waiters = _WaitRegistry(self.client)
 
     def get(self, task_id: str, timeout: Optional[int] = None) -> Any:
         """Get the result for a given task."""
-        time_step = 0.5
-        if timeout:
-            timeout_countdown = float(timeout)
-            while self.status(task_id) != "completed":
-                sleep(time_step)
-                timeout_countdown -= time_step
-                if timeout_countdown <= 0:
-                    status = self.status(task_id)
-                    raise Exception(
-                        "Timeout(get): Task result is not ready yet. "
-                        f"Task status: {status}"
-                    )
-
-        elif self.status(task_id) != "completed":
-            status = self.status(task_id)
+        # status and result are fetched together, so the result is already
+        # at hand when the task is completed
+        metadata = self.metadata.get_many(task_id, RESULT_FIELDS)
+        if timeout and metadata["status"] != b"completed":
+            metadata = self._wait(task_id, float(timeout))
+
+        if metadata["status"] != b"completed":
+            status = (metadata["status"] or b"").decode("utf8")
             raise Exception(
                 "Timeout(get): Task result is not ready yet. "
                 f"Task status: {status}"
             )
-        result = self.metadata.get(task_id, "result")
-        return pickle.loads(result) if result else result
-
-    def load(self, task_id: str) -> dict[str, Any]:
-        """Load the whole metadata for a given task."""
+        result = metadata["result"]
+        return _deserialize(result) if result else result
+
+    def _wait(self, task_id: str, timeout: float) -> dict[str, bytes]:
+        """Wait for the completion of a given task, up to the timeout."""
+        # the worker publishes on the task channel when the result is saved,
+        # so the waiter wakes up as soon as the task is completed. The status
+        # is checked after registering the waiter to close the race with a
+        # task that completed before that.
+        key = f"task:{task_id}:metadata"
+        deadline = monotonic() + timeout
+        event = self._waiters.register(
+            task_id, min(LISTENER_READY_TIMEOUT, timeout)
+        )
+        try:
+            delay = POLL_INITIAL_DELAY
+            metadata = self.metadata._get_many_raw(key, RESULT_FIELDS)
+            while metadata["status"] != b"completed":
+                timeout_countdown = deadline - monotonic()
+                if timeout_countdown <= 0:
+                    break
+                # pub/sub is fire-and-forget, so the status is polled again
+                # with an exponential backoff (plus jitter, to spread
+                # concurrent waiters) in case a message is missed
+                jitter = random.uniform(0, delay * 0.1)  # nosec B311
+                event.wait(timeout=min(delay + jitter, timeout_countdown))
+                event.clear()
+                delay = min(delay * 2, POLL_MAX_DELAY)
+                metadata = self.metadata._get_many_raw(key, RESULT_FIELDS)
+        finally:
+            self._waiters.unregister(task_id, event)
+        return metadata
+
+    def load(
+        self, task_id: str, attributes: Optional[list[str]] = None
+    ) -> dict[str, Any]:
+        """
+        Load the metadata for a given task.
+
+        If attributes are given, just these attributes are loaded.
+        """
+        if attributes:
+            return self.metadata.get_many(task_id, attributes)
         return self.metadata.get_all(task_id)
 
     def create(self, task_id: str, metadata: dict[str, Any]) -> None:
@@ -138,14 +450,106 @@ class ResultTaskManager:
         self.metadata.create(task_id, metadata)
 
     def save(self, task_id: str, result: Any) -> None:
-        """Save the result for a given task."""
-        self.metadata.update(task_id, "result", pickle.dumps(result))
+        """Save the result for a given task and mark it as completed."""
+        self.metadata.update(task_id, "result", _serialize(result))
+        self.metadata.update(
+            task_id, "status", "completed", channel=f"task:{task_id}:done"
+        )
 
     def status(self, task_id: str) -> str:
         """Get the status for a given task."""
         status = self.metadata.get(task_id, "status")
         return status.decode("utf8")
 
+    def close(self) -> None:
+        """Stop the completion listener and close the redis connections."""
+        self._waiters.close()
+        # the pool is given to the client, so it isn't closed with it
+        self.client.connection_pool.disconnect()
+
+
+@public
+class StreamResultTaskManager(ResultTaskManager):
+    """
+    Manage the result and metadata from tasks, using redis streams.
+
+    The completion of a task is appended to a stream, so the waiters block
+    on XREAD and can't miss it, even if they start waiting later or if the
+    connection is dropped in between. The completion is also published, so
+    it can be awaited from a ResultTaskManager.
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 6379,
+        db: int = 0,
+        max_connections: int = 50,
+    ) -> None:
+        """
+        Initialize StreamResultTaskManager.
+
+        Each blocked waiter holds one connection while it reads the stream,
+        so the waiters use their own connection pool, and they can't take
+        the connections needed to save the results they are waiting for.
+        """
+        super().__init__(host, port, db, max_connections)
+        pool = redis.BlockingConnectionPool(  # type: ignore[no-untyped-call]
+            host=host,
+            port=port,
+            db=db,
+            max_connections=max_connections,
+            timeout=POLL_INITIAL_DELAY,
+            health_check_interval=30,
+            decode_responses=False,
+        )
+        self._stream_client = redis.Redis(connection_pool=pool)
+
+    def _wait(self, task_id: str, timeout: float) -> dict[str, bytes]:
+        """Wait for the completion of a given task, up to the timeout."""
+        key = f"task:{task_id}:metadata"
+        stream = f"task:{task_id}:stream"
+        deadline = monotonic() + timeout
+        delay = POLL_INITIAL_DELAY
+        metadata = self.metadata._get_many_raw(key, RESULT_FIELDS)
+        while metadata["status"] != b"completed":
+            timeout_countdown = deadline - monotonic()
+            if timeout_countdown <= 0:
+                break
+            # reading from the beginning of the stream returns right away
+            # if the task was already completed; the block is bounded, so
+            # the status is also checked for the results saved without a
+            # stream entry
+            block = min(delay, timeout_countdown)
+            try:
+                self._stream_client.xread(
+                    {stream: 0}, count=1, block=max(int(block * 1000), 1)
+                )
+            except redis.ConnectionError:
+                # no connection available for the waiter, it checks the
+                # task status by itself meanwhile
+                sleep(min(block, max(deadline - monotonic(), 0)))
+            delay = min(delay * 2, POLL_MAX_DELAY)
+            metadata = self.metadata._get_many_raw(key, RESULT_FIELDS)
+        return metadata
+
+    def save(self, task_id: str, result: Any) -> None:
+        """Save the result for a given task and mark it as completed."""
+        stream = f"task:{task_id}:stream"
+        self.metadata.update(task_id, "result", _serialize(result))
+        self.metadata.update(
+            task_id, "status", "completed", channel=f"task:{task_id}:done"
+        )
+        pipe = self.client.pipeline()
+        pipe.xadd(stream, {"status": "completed"}, maxlen=1)
+        pipe.expire(stream, STREAM_TTL)
+        pipe.execute()  # type: ignore[no-untyped-call]
+
+    def close(self) -> None:
+        """Stop the completion listener and close the redis connections."""
+        super().close()
+        self._stream_client.connection_pool.disconnect()
+
 
 @public
 def create_result_task_manager() -> ResultTaskManager:
@@ -153,8 +557,20 @@ def create_result_task_manager() -> ResultTaskManager:
     redis_host: str = os.getenv("RETSU_REDIS_HOST", "localhost")
     redis_port: int = int(os.getenv("RETSU_REDIS_PORT", 6379))
     redis_db: int = int(os.getenv("RETSU_REDIS_DB", 0))
-
-    return ResultTaskManager(host=redis_host, port=redis_port, db=redis_db)
+    redis_pool_size: int = int(os.getenv("RETSU_REDIS_POOL_SIZE", 50))
+    result_backend: str = os.getenv("RETSU_RESULT_BACKEND", "pubsub")
+
+    manager_class = (
+        StreamResultTaskManager
+        if result_backend == "stream"
+        else ResultTaskManager
+    )
+    return manager_class(
+        host=redis_host,
+        port=redis_port,
+        db=redis_db,
+        max_connections=redis_pool_size,
+    )
 
 
 @public
@@ -170,14 +586,15 @@ def track_step(task_metadata: TaskMetadataManager) -> Callable[..., Any]:
             """Wrap a function for registering the task metadata."""
             task_id = kwargs["task_id"]
             step_id = kwargs.get("step_id", task_func.__name__)
+            key = f"task:{task_id}:step:{step_id}"
 
             step_metadata = task_metadata.step
 
-            step_metadata.update(task_id, step_id, "status", "started")
+            step_metadata._update_raw(key, {"status": "started"})
             result = task_func(*args, **kwargs)
-            step_metadata.update(task_id, step_id, "status", "completed")
-            result_pickled = pickle.dumps(result)
-            step_metadata.update(task_id, step_id, "result", result_pickled)
+            step_metadata._update_raw(
+                key, {"status": "completed", "result": _serialize(result)}
+            )
             return result
 
         return wrapper
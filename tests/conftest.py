@@ -2,44 +2,74 @@
 
 from __future__ import annotations
 
-import subprocess
-import time
+import os
 
-from typing import Generator
+from time import monotonic, sleep
+from typing import Any, Generator
 
+import fakeredis
 import pytest
 
+# max time (in seconds) to wait for the Celery worker to reply to a ping
+WORKER_READY_TIMEOUT = 10.0
 
-@pytest.fixture(autouse=True, scope="session")
-def setup() -> Generator[None, None, None]:
-    """Set up the services needed by the tests."""
-    try:
-        # # Run the `sugar build` command
-        # subprocess.run(["sugar", "build"], check=True)
-        # # Run the `sugar ext restart --options -d` command
-        # subprocess.run(
-        #     ["sugar", "ext", "restart", "--options", "-d"], check=True
-        # )
-        # # Sleep for 5 seconds
-        # time.sleep(5)
-
-        # Start the Celery worker
-        celery_process = subprocess.Popen(
-            [
-                "celery",
-                "-A",
-                "tests.celery_tasks",
-                "worker",
-                "--loglevel=debug",
-            ],
-        )
-
-        time.sleep(5)
 
+@pytest.fixture(scope="module")
+def celery_worker() -> Generator[None, None, None]:
+    """
+    Start the Celery worker needed by the Celery tests.
+
+    The worker threads are stopped at the end of each Celery test module,
+    so the other tests don't fork the task processes while they are alive.
+    """
+    # imported here because it connects to redis, which is not needed by
+    # the tests that use fakeredis
+    from celery.contrib.testing.worker import start_worker
+
+    from .celery_tasks import app
+
+    # Start an in-process Celery worker, the thread pool allows the tasks
+    # from the parallel tests to run concurrently. The readiness is checked
+    # with a broadcast ping, which doesn't use the result backend. Its
+    # replies are read from a connection closed before the tests, so it
+    # isn't inherited by the task processes forked by them.
+    with start_worker(
+        app,
+        pool="threads",
+        concurrency=10,
+        loglevel="debug",
+        perform_ping_check=False,
+    ):
+        deadline = monotonic() + WORKER_READY_TIMEOUT
+        with app.connection_for_write() as connection:
+            while not app.control.ping(timeout=0.1, connection=connection):
+                if monotonic() > deadline:
+                    raise Exception(
+                        "The Celery worker didn't reply to the ping in "
+                        f"{WORKER_READY_TIMEOUT} seconds."
+                    )
+                sleep(0.1)
         yield
 
-    finally:
-        # Teardown: Terminate the Celery worker
-        celery_process.terminate()
-        celery_process.wait()
-        # subprocess.run(["sugar", "ext", "stop"], check=True)
+
+@pytest.fixture
+def fake_redis(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Replace the redis client used by retsu.tracking with fakeredis.
+
+    The redis commands run in-process, set RETSU_TEST_REAL_REDIS=1 to use
+    the real redis server instead.
+    """
+    if os.getenv("RETSU_TEST_REAL_REDIS") == "1":
+        return
+
+    server = fakeredis.FakeServer()
+
+    def create_client(*args: Any, **kwargs: Any) -> Any:
+        return fakeredis.FakeRedis(server=server)
+
+    def create_async_client(*args: Any, **kwargs: Any) -> Any:
+        return fakeredis.FakeAsyncRedis(server=server)
+
+    monkeypatch.setattr("retsu.tracking.redis.Redis", create_client)
+    monkeypatch.setattr("retsu.asyncio.aioredis.Redis", create_async_client)
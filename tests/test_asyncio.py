@@ -0,0 +1,67 @@
+"""Tests for retsu asyncio tracking."""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from retsu.asyncio import AsyncResultTaskManager, run
+from retsu.tracking import ResultTaskManager
+
+
+class TestAsyncResultTaskManager:
+    """TestAsyncResultTaskManager."""
+
+    def test_save_and_get(self, fake_redis: None) -> None:
+        """Check the result saved for a task."""
+
+        async def check() -> None:
+            manager = AsyncResultTaskManager()
+            await manager.create("task-save", {"status": "starting"})
+            await manager.save("task-save", {"value": 42})
+
+            assert await manager.status("task-save") == "completed"
+            assert await manager.get("task-save") == {"value": 42}
+            await manager.aclose()
+
+        run(check())
+
+    def test_get_timeout(self, fake_redis: None) -> None:
+        """Check the error raised when the result is not ready."""
+
+        async def check() -> None:
+            manager = AsyncResultTaskManager()
+            await manager.create("task-timeout", {"status": "running"})
+            try:
+                with pytest.raises(Exception, match="Task status: running"):
+                    await manager.get("task-timeout", timeout=1)
+            finally:
+                await manager.aclose()
+
+        run(check())
+
+    def test_get_concurrent(self, fake_redis: None) -> None:
+        """Check many waiters for results saved by the sync manager."""
+        task_ids = [f"task-{i}" for i in range(20)]
+        sync_manager = ResultTaskManager()
+        for task_id in task_ids:
+            sync_manager.create(task_id, {"status": "running"})
+
+        async def save_later() -> None:
+            await asyncio.sleep(0.5)
+            for i, task_id in enumerate(task_ids):
+                sync_manager.save(task_id, i)
+
+        async def check() -> list[int]:
+            manager = AsyncResultTaskManager()
+            try:
+                results = await asyncio.gather(
+                    *[manager.get(task_id, timeout=5) for task_id in task_ids],
+                    save_later(),
+                )
+            finally:
+                await manager.aclose()
+            return results[:-1]
+
+        assert run(check()) == list(range(20))
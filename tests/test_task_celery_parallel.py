@@ -12,6 +12,8 @@ from retsu.celery import ParallelCeleryTask
 
 from .celery_tasks import task_sleep, task_sum
 
+pytestmark = pytest.mark.usefixtures("celery_worker")
+
 
 class MyResultTask(ParallelCeleryTask):
     """Task for the test."""
@@ -12,6 +12,8 @@ from retsu.celery import SerialCeleryTask
 
 from .celery_tasks import task_sleep, task_sum
 
+pytestmark = pytest.mark.usefixtures("celery_worker")
+
 
 class MyResultTask(SerialCeleryTask):
     """Task for the test."""
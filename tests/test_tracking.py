@@ -0,0 +1,244 @@
+"""Tests for retsu tracking."""
+
+from __future__ import annotations
+
+import os
+import pickle
+import threading
+
+from datetime import datetime
+from time import monotonic, sleep
+from typing import Any, Generator, cast
+
+import pytest
+
+from retsu import tracking
+from retsu.tracking import (
+    STREAM_TTL,
+    ResultTaskManager,
+    StreamResultTaskManager,
+    _deserialize,
+    _serialize,
+    _WaitRegistry,
+    track_step,
+)
+
+
+@pytest.fixture(params=[ResultTaskManager, StreamResultTaskManager])
+def result_manager(
+    request: pytest.FixtureRequest, fake_redis: None
+) -> Generator[ResultTaskManager, None, None]:
+    """Create a fixture for each ResultTaskManager class."""
+    manager: ResultTaskManager = request.param()
+    yield manager
+    manager.close()
+
+
+class TestResultTaskManager:
+    """TestResultTaskManager."""
+
+    def test_save_and_get(self, result_manager: ResultTaskManager) -> None:
+        """Check the result saved for a task."""
+        result_manager.create("task-save", {"status": "starting"})
+        result_manager.save("task-save", {"value": 42})
+
+        assert result_manager.status("task-save") == "completed"
+        assert result_manager.get("task-save") == {"value": 42}
+
+    def test_get_timeout(self, result_manager: ResultTaskManager) -> None:
+        """Check the error raised when the result is not ready."""
+        result_manager.create("task-timeout", {"status": "running"})
+
+        with pytest.raises(Exception, match="Task status: running"):
+            result_manager.get("task-timeout", timeout=1)
+
+    def test_get_wait(self, result_manager: ResultTaskManager) -> None:
+        """Check that get waits for a result saved by another thread."""
+        result_manager.create("task-wait", {"status": "running"})
+
+        def save_later() -> None:
+            sleep(0.5)
+            result_manager.save("task-wait", [1, 2, 3])
+
+        thread = threading.Thread(target=save_later)
+        thread.start()
+        result = result_manager.get("task-wait", timeout=5)
+        thread.join()
+
+        assert result == [1, 2, 3]
+
+    def test_close(self, result_manager: ResultTaskManager) -> None:
+        """Check that closing the manager stops the listener thread."""
+        result_manager._waiters.register("task-close")
+        thread = result_manager._waiters._thread
+        assert thread is not None and thread.is_alive()
+
+        result_manager.close()
+
+        assert not thread.is_alive()
+
+    def test_get_timeout_not_subscribed(
+        self,
+        result_manager: ResultTaskManager,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """Check the get timeout when the listener can't subscribe."""
+        monkeypatch.setattr(
+            _WaitRegistry,
+            "_listen",
+            lambda self, ready, stopped: stopped.wait(),
+        )
+        result_manager.create("task-unsubscribed", {"status": "running"})
+        start = monotonic()
+
+        with pytest.raises(Exception, match="Timeout"):
+            result_manager.get("task-unsubscribed", timeout=1)
+
+        assert monotonic() - start < 1.5
+
+    def test_get_wait_restart(self, result_manager: ResultTaskManager) -> None:
+        """Check that a stopped listener thread is started again."""
+        result_manager.create("task-restart", {"status": "running"})
+        with pytest.raises(Exception, match="Timeout"):
+            result_manager.get("task-restart", timeout=1)
+        result_manager._waiters.close()
+
+        threading.Timer(
+            0.5, result_manager.save, args=("task-restart", 1)
+        ).start()
+
+        assert result_manager.get("task-restart", timeout=5) == 1
+
+    def test_load_attributes(self, result_manager: ResultTaskManager) -> None:
+        """Check the metadata loaded for given attributes."""
+        result_manager.create(
+            "task-load", {"status": "starting", "created_at": 1}
+        )
+
+        metadata = result_manager.load("task-load", ["status", "missing"])
+
+        assert metadata == {"status": b"starting", "missing": None}
+
+
+@pytest.mark.parametrize(
+    "waiter_class,saver_class",
+    [
+        (ResultTaskManager, StreamResultTaskManager),
+        (StreamResultTaskManager, ResultTaskManager),
+    ],
+)
+def test_get_wait_cross_manager(
+    waiter_class: type[ResultTaskManager],
+    saver_class: type[ResultTaskManager],
+    fake_redis: None,
+) -> None:
+    """Check a result saved by the other ResultTaskManager class."""
+    waiter = waiter_class()
+    saver = saver_class()
+    waiter.create("task-cross", {"status": "running"})
+
+    threading.Timer(0.5, saver.save, args=("task-cross", 1)).start()
+    start = monotonic()
+
+    try:
+        assert waiter.get("task-cross", timeout=5) == 1
+        assert monotonic() - start < 2
+    finally:
+        waiter.close()
+        saver.close()
+
+
+def test_stream_expire(fake_redis: None) -> None:
+    """Check that the completion stream expires."""
+    manager = StreamResultTaskManager()
+    manager.create("task-expire", {"status": "running"})
+    manager.save("task-expire", 1)
+
+    try:
+        ttl = cast(int, manager.client.ttl("task:task-expire:stream"))
+        assert 0 < ttl <= STREAM_TTL
+    finally:
+        manager.close()
+
+
+def test_track_step(result_manager: ResultTaskManager) -> None:
+    """Check the metadata registered for a tracked step."""
+
+    @track_step(result_manager.metadata)
+    def double(value: int, task_id: str) -> int:
+        return value * 2
+
+    assert double(21, task_id="task-step") == 42
+
+    step = result_manager.metadata.step
+    assert step.get("task-step", "double", "status") == b"completed"
+    assert _deserialize(step.get("task-step", "double", "result")) == 42
+
+
+@pytest.mark.parametrize("value", [None, 0, "text", {"a": [1, 2]}, {1, 2}])
+def test_serialize(value: Any) -> None:
+    """Check the serialization round-trip of a result."""
+    assert _deserialize(_serialize(value)) == value
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        (1, 2),
+        {"a": (1, 2)},
+        [1, {"b": datetime(2024, 1, 1)}],
+        {1: "a"},
+        float("nan"),
+        True,
+    ],
+)
+def test_serialize_orjson_types(
+    value: Any, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Check the types of the round-trip with the orjson serializer."""
+    monkeypatch.setattr(tracking, "SERIALIZER", "orjson")
+
+    result = _deserialize(_serialize(value))
+
+    assert repr(result) == repr(value)
+
+
+def test_serialize_orjson(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Check that JSON-safe results are serialized with orjson."""
+    monkeypatch.setattr(tracking, "SERIALIZER", "orjson")
+    value = {"a": [1, 2.5, "text", None, False]}
+
+    data = _serialize(value)
+
+    assert data[:1] == b"J"
+    assert _deserialize(data) == value
+
+
+def test_serialize_compressed(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Check the serialization round-trip of a big result."""
+    monkeypatch.setattr(tracking, "COMPRESSION", "zstd")
+    value = {"values": list(range(10_000))}
+
+    data = _serialize(value)
+
+    assert data[:1] == b"Z"
+    assert len(data) < len(pickle.dumps(value))
+    assert _deserialize(data) == value
+
+
+def test_serialize_uncompressed(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Check big results that are not compressed."""
+    value = os.urandom(10_000)
+    assert _serialize(value)[:1] == b"P"
+
+    # incompressible data is kept as is
+    monkeypatch.setattr(tracking, "COMPRESSION", "zstd")
+    data = _serialize(value)
+
+    assert data[:1] == b"P"
+    assert _deserialize(data) == value
+
+
+def test_deserialize_untagged() -> None:
+    """Check results saved without a serializer tag."""
+    assert _deserialize(pickle.dumps([1, 2])) == [1, 2]